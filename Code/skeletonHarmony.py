@@ -32,16 +32,34 @@ Output options:
 4. simple template from the score in Romantext format (no analysis at all);
 in either Romantext cases (3, 4), this can be with or without a shorthand for measure equivalences.
 
+Score input can be either a parsed music21 score or (via RnAnalysis.fromFast) a MusicXML file
+read with loadScoreFast, which retrieves only the measures, time signatures, annotations and
+metadata that RnAnalysis needs, and leaves the full music21 parse until (if) it is required.
+Templates (4) need no music21 parse at all:
+see makeTemplate, and makeTemplates for many scores at once.
+
 """
 
-from copy import deepcopy
 import fractions
+import hashlib
+import os
 import re
+import xml.etree.ElementTree as ET
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+
+import numpy as np
 
 from music21 import chord
+from music21 import common
+from music21 import converter
+from music21 import expressions
 from music21 import key
+from music21 import metadata
+from music21 import meter
 from music21 import roman
-from music21 import repeat
+from music21 import stream
 
 
 # ------------------------------------------------------------------------------
@@ -94,15 +112,22 @@ class RnAnalysis:
         self.combinedList = []
 
         # Score, location of analysis, total measures
-        self.score = score
+        if isinstance(score, FastScore):
+            self.fastScore = score
+            self._score = None  # Parsed with music21 if and when needed (see the score property)
+            measureNumbers = self.fastScore.measures
+        else:
+            self.fastScore = None
+            self._score = score
+            measureNumbers = [m.measureNumber for m in
+                              self.score.parts[0].getElementsByClass("Measure")]
         self.analysisPartNo = analysisPartNo  # Part number
         self.templateParts = templateParts
-        measures = self.score.parts[0].getElementsByClass("Measure")
-        self.firstMeasureNumber = measures[0].measureNumber
+        self.firstMeasureNumber = int(measureNumbers[0])
         if self.firstMeasureNumber not in [0, 1]:
             raise ValueError("The first measure number should be 1, or 0 for anacruses. "
                              f"It is currently {self.firstMeasureNumber}.")
-        self.lastMeasureNumber = measures[-1].measureNumber
+        self.lastMeasureNumber = int(measureNumbers[-1])
 
         self.timeSignatures = None
         self.timeSigMeasureDict = None
@@ -111,6 +136,7 @@ class RnAnalysis:
         self.deducedAnalysis = None
 
         self.tempScore = None
+        self.tempPartFingerprints = None
 
         # Textual annotations
         self.annotationsAndLocations = None
@@ -130,15 +156,42 @@ class RnAnalysis:
         self.preamble = []
         self.prepPreamble()
 
+    @classmethod
+    def fromFast(cls,
+                 path,
+                 **kwargs):
+        """
+        Alternative constructor reading a MusicXML file at `path` with loadScoreFast
+        instead of a full music21 parse.
+
+        All keyword arguments are as for the main constructor.
+        The music21 score is only parsed if and when a method needs it
+        (e.g. chfyChordAndLabel, writeScore).
+        """
+        fastScore = loadScoreFast(path,
+                                  annotationTextClass=kwargs.get("annotationTextClass", "Lyric"))
+        return cls(fastScore, **kwargs)
+
+    @property
+    def score(self):
+        """
+        The music21 score: either as passed in, or parsed on first access from the fastScore path.
+        """
+        if self._score is None:
+            self._score = converter.parse(self.fastScore.path)
+        return self._score
+
     def getTSs(self):
         """
         Retrieve all time signatures and make timeSignatures dict.
         """
 
-        self.timeSignatures = self.score.parts[0].recurse().getElementsByClass("TimeSignature")
-        self.timeSigMeasureDict = {}
-        for x in self.timeSignatures:
-            self.timeSigMeasureDict[x.measureNumber] = x.ratioString
+        if self.fastScore is not None:
+            self.timeSigMeasureDict = dict(self.fastScore.timeSigs)
+            return
+
+        self.timeSignatures = self.score.parts[0].recurse().getElementsByClass(meter.TimeSignature)
+        self.timeSigMeasureDict = {x.measureNumber: x.ratioString for x in self.timeSignatures}
 
     def prepPreamble(self):
         """
@@ -146,14 +199,23 @@ class RnAnalysis:
         1. User defined takes priority (no action here or below),
         2. Then anything retrievable from the score (see prepPreamble),
         3. Failing 1 and 2, placeholders.
+        Runs once (from __init__): later calls leave the preamble as it is.
         """
 
+        if self.preamble:
+            return
+
+        if self.fastScore is not None:
+            md = self.fastScore.metadata
+        else:
+            md = self.score.metadata
+
         if self.composer:  # default unless set
             self.preamble.append(f"Composer: {self.composer}")
         else:
 
-            if self.score.metadata.composer:
-                self.composer = self.score.metadata.composer  # overwrite
+            if md.composer:
+                self.composer = md.composer  # overwrite
                 self.preamble.append(f"Composer: {self.composer}")
             else:
                 self.composer = "Unknown"
@@ -165,13 +227,13 @@ class RnAnalysis:
         else:
             workingTitle = []
 
-            if self.score.metadata.title:
-                workingTitle.append(self.score.metadata.title)
-            if self.score.metadata.movementNumber:
-                workingTitle.append(f"- No.{self.score.metadata.movementNumber}:")  # Spaces later
-            if self.score.metadata.movementName:
-                if self.score.metadata.movementName != self.score.metadata.title:
-                    workingTitle.append(self.score.metadata.movementName)
+            if md.title:
+                workingTitle.append(md.title)
+            if md.movementNumber:
+                workingTitle.append(f"- No.{md.movementNumber}:")  # Spaces later
+            if md.movementName:
+                if md.movementName != md.title:
+                    workingTitle.append(md.movementName)
 
             if len(workingTitle) > 0:
                 self.title = " ".join(workingTitle)
@@ -203,25 +265,57 @@ class RnAnalysis:
         Used whether the input is a full analysis or just a reduction.
         """
 
-        self.annotationsAndLocations = []
+        fs = self.fastScore
+        if fs is not None and fs.annotationTextClass == self.annotationTextClass:
+            annotations = self._fastScoreAnnotations()
+        else:
+            annotations = self._scoreAnnotations()
 
-        if self.annotationTextClass == "Lyric":
-            for n in self.score.parts[self.analysisPartNo].recurse().notes:
-                if n.lyric:
-                    txt = n.lyric
-                    if self.adaptText:
-                        txt = fixTextRn(txt)
+        self.annotationsAndLocations = []
+        for measureNumber, beat, txt in annotations:
+            if self.adaptText:
+                txt = fixTextRn(txt)
+            self.annotationsAndLocations.append([measureNumber, beat, txt])
 
-                    self.annotationsAndLocations.append([n.measureNumber, n.beat, txt])
+    def _fastScoreAnnotations(self):
+        """
+        The [measureNumber, beat, text] of each annotation in the analysis part,
+        as already retrieved by loadScoreFast.
+        """
+        fs = self.fastScore
+        numParts = len(fs.annotations)
+        if not -numParts <= self.analysisPartNo < numParts:
+            raise ValueError(f"The analysisPartNo (currently {self.analysisPartNo}) must be "
+                             f"the index of a part. This score has {numParts} parts.")
+        measureNumbers, beats, texts = fs.annotations[self.analysisPartNo]
+        return ([int(measureNumber), float(beat), txt]
+                for measureNumber, beat, txt in zip(measureNumbers, beats, texts))
+
+    def _scoreAnnotations(self):
+        """
+        The [measureNumber, beat, text] of each annotation
+        in the analysis part of the music21 score.
 
+        One pass, measure by measure, working out beats directly rather than with each
+        element's .measureNumber and .beat (both of which search the element's contexts).
+        """
+        if self.annotationTextClass == "Lyric":
+            def annotations(m):  # Notes with lyrics
+                return ((n, n.lyric) for n in m.recurse().notes if n.lyric)
         else:  # self.annotationTextClass == "TextExpression":
-            for elem in self.score.parts[self.analysisPartNo].recurse():
-                if "TextExpression" in elem.classes:
-                    txt = elem.content  # Note
-                    if self.adaptText:
-                        txt = fixTextRn(txt)
-
-                    self.annotationsAndLocations.append([elem.measureNumber, elem.beat, txt])
+            def annotations(m):  # All text expressions
+                return ((e, e.content)
+                        for e in m.recurse().getElementsByClass(expressions.TextExpression))
+
+        timeSignature = _timeSignature("4/4")  # music21 default, pending one in the score
+        for m in self.score.parts[self.analysisPartNo].getElementsByClass(stream.Measure):
+            if m.timeSignature is not None:
+                timeSignature = m.timeSignature
+            for elem, txt in annotations(m):
+                offset = elem.offset
+                if elem.activeSite is m:  # Padding only for elements outside voices (as .beat)
+                    offset += m.paddingLeft
+                yield [m.measureNumber, _beatFromOffset(timeSignature, offset), txt]
 
     # ------------------------------------------------------------------------------
 
@@ -251,9 +345,11 @@ class RnAnalysis:
 
         self.deducedAnalysis = []
 
-        reduction = deepcopy(self.score)
-        for x in range(ignoreParts):
-            reduction.remove(reduction.parts[0])  # Top parts of the original score
+        # Ignore the top parts of the original score. No need to copy the rest:
+        # stripTies and chordify make new streams without changing the score.
+        reduction = stream.Score()
+        for p in self.score.parts[ignoreParts:]:
+            reduction.insert(0, p)
 
         self.chfyScore = reduction.stripTies().chordify()
         self.chfyScore.partName = "Roman"
@@ -261,6 +357,7 @@ class RnAnalysis:
         currentIndex = 0  # Index
         currentKey = "FAKE KEY"  # Initialise empty for inclusion of the first key
         currentTonicization = None
+        localKeyId = None  # The (tonicization, key) that localKey was worked out for
 
         if not self.annotationsAndLocations:
             self.getAnnotationsAndLocations()
@@ -268,15 +365,33 @@ class RnAnalysis:
         keyData = self.annotationsAndLocations
         lenKeyData = len(keyData)
 
-        for ch in self.chfyScore.recurse().notes:
+        # Resolve each chord's measure and beat once: both look up the context.
+        # The annotations follow in score order, measure by measure (not by measure number,
+        # which may repeat, e.g. in a minuet and trio).
+        chordTable = []
+        for m in self.chfyScore.getElementsByClass(stream.Measure):
+            chordTable += [(m.measureNumber, float(ch.beat), ch) for ch in m.recurse().notes]
+            chordTable.append((m.measureNumber, None, None))  # End of the measure
+
+        for measureNumber, beat, ch in chordTable:
+
+            # Move past annotations of this measure that fall on no chord (before this one,
+            # or anywhere at the end of the measure), rather than stall on them.
+            while (lenKeyData > currentIndex
+                    and measureNumber == keyData[currentIndex][0]
+                    and (beat is None or float(keyData[currentIndex][1]) < beat)):
+                currentIndex += 1
+            if ch is None:
+                continue
 
             startKey = currentKey
             if not tonicizationsRemainInEffect:
                 currentTonicization = None  # reset for each chord
 
             # Key Changes and Tonicization
-            if lenKeyData > currentIndex and [ch.measureNumber, ch.beat] == keyData[currentIndex][
-                                                                            0:2]:
+            if (lenKeyData > currentIndex
+                    and measureNumber == keyData[currentIndex][0]
+                    and beat == float(keyData[currentIndex][1])):
                 stringInQuestion = keyData[currentIndex][2]  # Before updating current index
                 currentIndex += 1
                 if "/" in stringInQuestion:  # Indicates a local tonicization (X/Y)
@@ -294,22 +409,23 @@ class RnAnalysis:
                     else:
                         # TODO accept anything else as a full, user-defined Roman numeral?
                         raise ValueError(f"Unrecognised entry {stringInQuestion} "
-                                         f"in measure {ch.measureNumber}, "
-                                         f"beat {ch.beat}")
+                                         f"in measure {measureNumber}, "
+                                         f"beat {beat}")
 
             if not currentTonicization:
-                rn = roman.romanNumeralFromChord(ch,
-                                                 key.Key(currentKey),
-                                                 preferSecondaryDominants=prefer_secondary)
+                lyric = rnFigureFromChord(ch,
+                                          currentKey,
+                                          preferSecondaryDominants=prefer_secondary)
             else:  # currentTonicization
-                localKey = getLocalKey(currentTonicization, currentKey)
-                rn = roman.romanNumeralFromChord(ch,
-                                                 key.Key(localKey),
-                                                 # sixthMinor=roman.Minor67Default.CAUTIONARY,
-                                                 # seventhMinor=roman.Minor67Default.CAUTIONARY,
-                                                 )  # TODO: issues with sixth and seventh minor
-
-            lyric = str(rn.figure)
+                # Only work out each new local key
+                if (currentTonicization, currentKey) != localKeyId:
+                    localKeyId = (currentTonicization, currentKey)
+                    localKey = getLocalKey(currentTonicization, getKey(currentKey))
+                lyric = rnFigureFromChord(ch,
+                                          localKey,
+                                          # sixthMinor=roman.Minor67Default.CAUTIONARY,
+                                          # seventhMinor=roman.Minor67Default.CAUTIONARY,
+                                          )  # TODO: issues with sixth and seventh minor
 
             # Lyric modifications. Otherwise the lyric is unchanged
             if startKey != currentKey:
@@ -319,7 +435,7 @@ class RnAnalysis:
 
             ch.lyric = lyric
 
-            thisData = [ch.measureNumber, ch.beat, lyric]
+            thisData = [measureNumber, beat, lyric]
             self.deducedAnalysis.append(thisData)
 
     # ------------------------------------------------------------------------------
@@ -339,25 +455,23 @@ class RnAnalysis:
                 self.getAnnotationsAndLocations()  # ... and that the full analysis is on score
             infoToUse = self.annotationsAndLocations
 
-        firstMeasure = infoToUse[0][0]
-
-        currentMeasure = firstMeasure
-        currentString = None
+        currentMeasure = infoToUse[0][0]
+        tokens = [f"m{currentMeasure}"]  # Joined once per measure. Entries as for rnString.
 
         self.analysisDict = {}
 
-        for item in infoToUse:
-            measureX = item[0]
+        for measureX, beat, figure in infoToUse:
 
-            if measureX == currentMeasure:  # continue an existing string
-                currentString = rnString(item, inString=currentString)
-            else:
-                self.analysisDict[currentMeasure] = currentString  # Save previous string ...
-                currentString = rnString(item)  # ... and start a new one.
-            currentMeasure = measureX
+            if measureX != currentMeasure:
+                self.analysisDict[currentMeasure] = " ".join(tokens)  # Save previous measure ...
+                currentMeasure = measureX
+                tokens = [f"m{currentMeasure}"]  # ... and start a new one.
+
+            bt = intBeat(beat)
+            tokens.append(f"{figure}" if bt == 1 else f"b{bt} {figure}")
 
-        # Special case of last entry. Note currentMeasure = measureX so either is fine.
-        self.analysisDict[currentMeasure] = currentString
+        # Special case of last entry.
+        self.analysisDict[currentMeasure] = " ".join(tokens)
 
     # ------------------------------------------------------------------------------
 
@@ -369,13 +483,17 @@ class RnAnalysis:
         Finds equivalent passages (e.g. song verses) to avoid duplicating the same material
         and to encourage (but not require!) parallel analyses for identical passages.
 
-        Works by comparing measures of the whole score using music21"s RepeatFinder.
+        Works by comparing measures of the whole score:
+        each measure (across all the parts in question) is reduced to a fingerprint of its notes
+        (see _partFingerprints and _measureFingerprints),
+        and contiguous runs of identical measures are found from those
+        (see _similarMeasureGroups, which follows music21's RepeatFinder).
 
         Optionally: reduce the parts to consider in the comparison by specifying "partsToRemove".
         This removes parts from the bottom of the score (in the expectation of parts
         corresponding to the "analysis" parts of the romanUmpire.ScoreAndAnalysis).
 
-        Notes for using the RepeatFinder:
+        Notes for using the repeats:
         1.
         Key changes not preserved for the part following a measure range equality.
         This can lead to errors if the key changes in the latter case but is not specified in the
@@ -394,7 +512,14 @@ class RnAnalysis:
 
         self.processTemplateParts()
 
-        simMGs = repeat.RepeatFinder(self.tempScore).getSimilarMeasureGroups(threshold=threshold)
+        if self.fastScore is not None:  # Already fingerprinted by loadScoreFast: no music21 parse
+            partFingerprints = self.tempPartFingerprints
+        else:
+            partFingerprints = _partFingerprints(self.tempScore)
+        fingerprints = _measureFingerprints(partFingerprints)
+        simMGs = _similarMeasureGroups(fingerprints,
+                                       firstMeasureNumber=self.firstMeasureNumber,
+                                       threshold=threshold)
 
         # Separate into static function def simplify() for getting
         # from list of contiguous measures to "From-to = from-to" pairs
@@ -412,28 +537,32 @@ class RnAnalysis:
               "must be either the string \"all\" (default) or a list of non-negative integers " \
               "corresponding to the part number in the score (counting from 0)."
 
-        if self.templateParts == "all":
-            self.tempScore = self.score  # No adjustment, so avoid (no need to) deepcopy
-            return
+        if self.fastScore is not None:
+            numParts = len(self.fastScore.partFingerprints)
         else:
-            if not isinstance(self.templateParts, list):
-                raise ValueError(msg)
-            else:  # It is a list
-                for x in self.templateParts:
-                    if not isinstance(x, int):
-                        raise ValueError(msg)
-                    if x < 0:
-                        raise ValueError(msg)
+            numParts = len(self.score.parts)
 
-            self.tempScore = deepcopy(self.score)
+        if self.templateParts != "all":
+            if not isinstance(self.templateParts, list) \
+                    or not all(isinstance(x, int) for x in self.templateParts):
+                raise ValueError(msg)
+            if any(x < 0 or x >= numParts for x in self.templateParts):
+                raise ValueError(msg + f" This score has {numParts} parts.")
 
-            partsToRemove = []
-            for x in range(len(self.score.parts)):  # TODO: part number attribute?
-                if x not in self.templateParts:
-                    partsToRemove.append(x)
+        selectsAll = self.templateParts == "all" or set(self.templateParts) == set(range(numParts))
 
-            for x in partsToRemove[::-1]:  # Note: reverse order is important
-                self.tempScore.remove(self.score.parts[x])
+        # The parts in question: as fingerprints for a fastScore (see getRepeats)
+        if self.fastScore is not None:
+            self.tempPartFingerprints = [f for x, f in enumerate(self.fastScore.partFingerprints)
+                                         if selectsAll or x in self.templateParts]
+        elif selectsAll:
+            self.tempScore = self.score  # No adjustment
+        else:
+            # The parts in question, in score order. No need to copy: they are only compared.
+            self.tempScore = stream.Score()
+            for x, p in enumerate(self.score.parts):  # TODO: part number attribute?
+                if x in self.templateParts:
+                    self.tempScore.insert(0, p)
 
     def prepList(self,
                  template: bool = True):
@@ -452,36 +581,39 @@ class RnAnalysis:
         # TODO: option for removing duplicate analysis from repeat passages
         # TODO: similar option for recurring harmonies (repeats on the rntxt)?
 
-        tsMeasures = self.timeSigMeasureDict.keys()
-
         self.getRepeats()  # Sets measureRangeEqualities
-        measureRangeEqualityStarts = self.measureRangeEqualities.keys()
 
         if not template:
             self.makeMeasureStrings()
 
+        # Local names for the loop (once per measure). Test membership on the dicts directly.
+        timeSigMeasureDict = self.timeSigMeasureDict
+        measureRangeEqualities = self.measureRangeEqualities
+        analysisDict = None if template else self.analysisDict
+        combinedList = self.combinedList
+
         for x in range(self.firstMeasureNumber, self.lastMeasureNumber + 1):
 
             # Time signatures (whether a template or not)
-            if x in tsMeasures:  # First, before corresponding measure analysis
-                ts = self.timeSigMeasureDict[x]
-                self.combinedList.append(f"\nTime Signature: {ts}")
+            if x in timeSigMeasureDict:  # First, before corresponding measure analysis
+                ts = timeSigMeasureDict[x]
+                combinedList.append(f"\nTime Signature: {ts}")
 
             # Measure range equalities (currently a duplicate)
-            if x in measureRangeEqualityStarts:
-                entry = self.measureRangeEqualities[x]
+            if x in measureRangeEqualities:
+                entry = measureRangeEqualities[x]
                 if entry[0] == entry[1]:  # Single measure comparison
-                    self.combinedList.append(f"Note: m{entry[0]} = m{entry[2]}")
+                    combinedList.append(f"Note: m{entry[0]} = m{entry[2]}")
                 else:  # Measure range comparison
-                    self.combinedList.append(
+                    combinedList.append(
                         f"Note: m{entry[0]}-{entry[1]} = m{entry[2]}-{entry[3]}")
 
             # Measure lines (analysis where provide; empty for template)
             if template:
-                self.combinedList.append(f"m{x} b1")
+                combinedList.append(f"m{x} b1")
             else:
-                if x in self.analysisDict.keys():
-                    self.combinedList.append(self.analysisDict[x])
+                if x in analysisDict:
+                    combinedList.append(analysisDict[x])
                 # else:  # Not template and annotation in this measure, leave blank
 
     # ------------------------------------------------------------------------------
@@ -502,10 +634,8 @@ class RnAnalysis:
         if not fileName:  # Never an empty string: placeholders set by prepPreamble as needed.
             fileName = f"{self.composer}_-_{self.title}"
 
-        text_file = open(f"{outPath}{fileName}.txt", "w")
-        [text_file.write(entry + "\n") for entry in self.preamble]
-        [text_file.write(entry + "\n") for entry in self.combinedList]
-        text_file.close()
+        with open(os.path.join(outPath, f"{fileName}.txt"), "w", encoding="utf-8") as text_file:
+            text_file.write("".join(f"{entry}\n" for entry in self.preamble + self.combinedList))
 
     def writeScore(self,
                    outPath: str = "./",
@@ -522,13 +652,574 @@ class RnAnalysis:
 
         if not fileName:
             fileName = self.title
-        self.score.write(fp=f"{outPath}{fileName}.musicxml")
+        self.score.write(fp=os.path.join(outPath, f"{fileName}.musicxml"))
+
+
+# ------------------------------------------------------------------------------
+
+# Fast score loading
+
+class FastScore:
+    """
+    The light data that RnAnalysis uses from a score,
+    as retrieved by loadScoreFast without building any music21 streams.
+
+    Annotations (of the class self.annotationTextClass, as for RnAnalysis)
+    are stored for every part as separate arrays of measure numbers, beats, and texts,
+    so that the choice of part (analysisPartNo) is left to their use.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.metadata = metadata.Metadata()
+        self.measures = np.array([], dtype=np.int32)  # measure numbers of the first part
+        self.timeSigs = {}  # measure number: ratio string, first part
+        self.annotationTextClass = "Lyric"
+        self.annotations = []  # per (staff-separated) part: (measure numbers, beats, texts)
+        # Per (staff-separated) part, one per measure: see _partFingerprints
+        self.partFingerprints = []
+
+
+def loadScoreFast(path,
+                  annotationTextClass: str = "Lyric"):
+    """
+    Reads a MusicXML (.mxl, .musicxml, .xml) file into a FastScore,
+    streaming through the file once with ElementTree.iterparse.
+
+    As in music21, parts with more than one staff are treated as separate parts (one per staff),
+    and incomplete opening measures are treated as anacruses for the purpose of beat positions.
+    """
+
+    path = str(path)
+    if annotationTextClass not in ["Lyric", "TextExpression"]:
+        raise ValueError(f"The annotationTextClass (currently {annotationTextClass}) must be "
+                         "either \"Lyric\" (default), or \"TextExpression\".")
+
+    fastScore = FastScore(path)
+    fastScore.annotationTextClass = annotationTextClass
+
+    if path.endswith(".mxl"):
+        with zipfile.ZipFile(path) as archive:
+            with archive.open(_mxlRootFile(archive)) as f:
+                annotationsByPart = _parseMusicXML(f, fastScore)
+    else:
+        with open(path, "rb") as f:
+            annotationsByPart = _parseMusicXML(f, fastScore)
+
+    # Titles as in music21's MusicXML import
+    if fastScore.metadata.title == fastScore.metadata.movementName:
+        fastScore.metadata.title = None
+    if fastScore.metadata.movementName is None:
+        fastScore.metadata.movementName = os.path.basename(path)
+
+    for rows in annotationsByPart:
+        fastScore.annotations.append((np.array([r[0] for r in rows], dtype=np.int32),
+                                      np.array([float(r[1]) for r in rows], dtype=np.float64),
+                                      [r[2] for r in rows]))
+
+    return fastScore
+
+
+def makeTemplate(path,
+                 outPath: str = "./",
+                 fileName: str = "",
+                 **kwargs):
+    """
+    Write a Romantext template (metadata, time signatures, measures, and repeats as notes)
+    for the MusicXML file at `path` entirely from loadScoreFast, without any music21 parse.
+
+    Keyword arguments are as for RnAnalysis (e.g. templateParts, composer, title).
+    Returns the RnAnalysis.
+    """
+    analysis = RnAnalysis.fromFast(path, **kwargs)
+    analysis.prepList(template=True)
+    analysis.writeRomanText(outPath=outPath, fileName=fileName)
+    return analysis
+
+
+def makeTemplates(paths,
+                  fileName: str = "template",
+                  overwrite: bool = False,
+                  workers: int | None = None,
+                  **kwargs):
+    """
+    Make a template (see makeTemplate) for each of the MusicXML files in `paths`,
+    written alongside the score as `fileName`.txt (i.e. "template.txt", as in the corpus).
+    If `overwrite` is False, scores that already have that file are skipped.
+
+    The scores are independent, so they are shared out over a pool of processes:
+    `workers` of them (default: one per CPU).
+    Keyword arguments are as for RnAnalysis and apply to every score.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # list() to wait for all, and raise any error
+        list(executor.map(partial(_makeTemplateBesideScore,
+                                  fileName=fileName,
+                                  overwrite=overwrite,
+                                  **kwargs),
+                          paths,
+                          chunksize=8))
+
+
+def _makeTemplateBesideScore(path,
+                             fileName: str = "template",
+                             overwrite: bool = False,
+                             **kwargs):
+    """
+    One score for makeTemplates. Returns nothing, so as not to send the analysis between processes.
+    """
+    outPath = os.path.dirname(os.path.abspath(path))
+    if overwrite or not os.path.exists(os.path.join(outPath, f"{fileName}.txt")):
+        makeTemplate(path, outPath=outPath, fileName=fileName, **kwargs)
+
+
+def _mxlRootFile(archive: zipfile.ZipFile) -> str:
+    """
+    Name of the score file within a compressed (.mxl) MusicXML archive.
+    """
+    names = archive.namelist()
+    if "META-INF/container.xml" in names:
+        container = ET.fromstring(archive.read("META-INF/container.xml"))
+        rootFile = container.find(".//rootfile")
+        if rootFile is not None and rootFile.get("full-path"):
+            return rootFile.get("full-path")
+    for name in names:
+        if not name.startswith("META-INF") and name.endswith((".xml", ".musicxml")):
+            return name
+    raise ValueError(f"No MusicXML score found in {names}.")
+
+
+def _parseMusicXML(f, fastScore: FastScore) -> list:
+    """
+    Stream through a (partwise) MusicXML file,
+    setting the metadata, measures, timeSigs and partFingerprints of fastScore and
+    returning the annotations for each (staff-separated) part as a list of
+    [measureNumber, beat, text] lists.
+    """
+
+    annotationsByPart = []
+    partParser = None
+    finale = False
+
+    for event, elem in ET.iterparse(f, events=("start", "end")):
+        tag = elem.tag
+
+        if event == "start":
+            if tag == "score-timewise":
+                raise ValueError("Timewise MusicXML is not supported by loadScoreFast.")
+            if tag == "part":
+                partParser = _FastPartParser(fastScore.annotationTextClass, finale=finale)
+            continue
+
+        if tag == "measure":
+            partParser.parseMeasure(elem)
+            elem.clear()
+
+        elif tag == "part":
+            _addPart(partParser, fastScore, annotationsByPart)
+            elem.clear()
+
+        elif tag in {"work", "movement-number", "movement-title", "identification"}:
+            _addMetadata(elem, fastScore.metadata)
+            if tag == "identification":
+                finale = _isFromFinale(elem)
+
+    return annotationsByPart
+
+
+def _addPart(partParser, fastScore: FastScore, annotationsByPart: list):
+    """
+    Add a parsed part to fastScore (measures and time signatures from the first part only)
+    and its annotations to annotationsByPart, one staff at a time, as music21's PartStaffs.
+    """
+    if not annotationsByPart:  # First part
+        fastScore.measures = np.array(partParser.measureNumbers, dtype=np.int32)
+        fastScore.timeSigs = partParser.timeSigs
+    for staffNumber in sorted(partParser.staves):
+        annotationsByPart.append(partParser.staves[staffNumber])
+        fastScore.partFingerprints.append(
+            np.array(partParser.fingerprints.get(staffNumber, []), dtype=np.uint64))
+
+
+class _FastPartParser:
+    """
+    Running state for one MusicXML part (divisions, time signature, anacruses) and
+    the annotations retrieved from it, by staff number.
+    """
+
+    def __init__(self,
+                 annotationTextClass: str = "Lyric",
+                 finale: bool = False):
+        self.annotationTextClass = annotationTextClass
+        self.finale = finale  # Written by Finale (first software tag), for music21's workarounds
+        self.divisions = 1
+        self.timeSignature = _timeSignature("4/4")  # music21 default
+        self.firstMeasure = True
+        self.lastMeasureNumber = None
+        self.lastMeasureWasShort = False
+        self.measureNumbers = []
+        self.timeSigs = {}  # measure number: ratio string
+        self.staves = {1: []}  # staff number: list of [measureNumber, beat, text]
+        self.fingerprints = {1: []}  # staff number: list of fingerprints, one per measure
+
+    def _duration(self, mxObj) -> fractions.Fraction:
+        return fractions.Fraction(int(float(mxObj.findtext("duration", "0"))), self.divisions)
+
+    def parseMeasure(self, mxMeasure):
+        """
+        Retrieve the measure number, any time signature, the fingerprint and
+        the annotations of one MusicXML measure.
+        """
+
+        measureNumber = self._measureNumber(mxMeasure)
+        self.measureNumbers.append(measureNumber)
+        self._startMeasure(mxMeasure)
+
+        for mxObj in mxMeasure:
+            tag = mxObj.tag
+            if tag == "attributes":
+                ratioString = self._parseAttributes(mxObj)
+                if ratioString:
+                    self.timeSigs[measureNumber] = ratioString
+            elif tag == "note":
+                self._parseNote(mxObj)
+            elif tag == "backup":  # Floor as music21 (rounded durations)
+                self.offset = max(self.offset - self._duration(mxObj), 0)
+            elif tag == "forward":
+                self._parseForward(mxObj)
+            elif tag == "direction" and self.annotationTextClass == "TextExpression":
+                self._parseDirection(mxObj)
+            self.highestTime = max(self.highestTime, self.offset)
+
+        barDuration = common.opFrac(self.timeSignature.barDuration.quarterLength)
+        self._applyFullMeasureRest(barDuration)
+        paddingLeft = self._paddingLeft(barDuration)
+
+        for staffNumber in self.fingerprints:
+            staffNotes = self.notes.get(staffNumber, [])
+            self.fingerprints[staffNumber].append(_notesFingerprint(staffNotes))
+        self._measureAnnotations(measureNumber, paddingLeft)
+
+    def _measureNumber(self, mxMeasure) -> int:
+        """
+        The measure number, as music21: including its special case for the unnumbered
+        measures that Finale writes as "X1" etc. (given the number of the measure before).
+        """
+        measureNumber, suffix = common.getNumFromStr(mxMeasure.get("number", ""))
+        measureNumber = int(measureNumber) if measureNumber else 0
+        if suffix == "X" and self.lastMeasureNumber is not None \
+                and measureNumber != self.lastMeasureNumber + 1:
+            measureNumber = self.lastMeasureNumber
+        self.lastMeasureNumber = measureNumber
+        return measureNumber
+
+    def _startMeasure(self, mxMeasure):
+        """
+        Reset the running state for a new measure.
+        """
+        self.offset = fractions.Fraction(0)
+        self.lastNoteOffset = self.offset
+        self.lastNoteDuration = self.offset
+        self.lastNoteCounted = False
+        self.highestTime = self.offset
+        self.noteCount = self.restCount = 0
+        self.fullMeasureRest = False
+        # (note entry, element, offset, duration, marked as a full measure rest)
+        self.firstRest = None
+        self.entries = []  # [staff number, offset, texts, in a voice, voice]
+        self.chordEntry = None  # The entry for the lyrics of the current chord (if any)
+        self.voice = ""
+        # Staff number: list of [MIDI pitch, offset, duration] as for _partFingerprints
+        self.notes = {}
+        voices = {mxObj.findtext("voice") for mxObj in mxMeasure
+                  if mxObj.tag in {"note", "forward"} and mxObj.find("voice") is not None}
+        self.useVoices = len(voices) > 1  # As music21
+
+    def _parseAttributes(self, mxAttributes) -> str | None:
+        """
+        Update the divisions, time signature and staves.
+        Returns the ratio string of any time signature.
+        """
+        if mxAttributes.find("divisions") is not None:
+            self.divisions = int(float(mxAttributes.findtext("divisions")))
+        for staffNumber in range(1, int(mxAttributes.findtext("staves", "1")) + 1):
+            self.staves.setdefault(staffNumber, [])
+            self.fingerprints.setdefault(staffNumber, [])
+        mxTime = mxAttributes.find("time")
+        if mxTime is None or mxTime.find("beats") is None:
+            return None
+        ratioString = f"{mxTime.findtext('beats')}/{mxTime.findtext('beat-type')}"
+        self.timeSignature = _timeSignature(ratioString)
+        return ratioString
+
+    def _parseNote(self, mxNote):
+        """
+        One note, rest, or chord member: its fingerprint entry, rest count, and any lyrics.
+        """
+        isChordNote = mxNote.find("chord") is not None
+        noteEntry, noteOffset, noteDuration = self._noteEntry(mxNote, isChordNote)
+        self.notes.setdefault(int(mxNote.findtext("staff", "1")), []).append(noteEntry)
+        self._countNote(mxNote, isChordNote, noteEntry, noteOffset, noteDuration)
+
+        self.voice = (mxNote.findtext("voice") or "").strip() or self.voice
+        if not isChordNote:
+            self.chordEntry = None
+        if self.annotationTextClass == "Lyric" and mxNote.find("rest") is None:
+            self._addLyrics(mxNote, noteOffset)
+
+    def _noteEntry(self, mxNote, isChordNote: bool):
+        """
+        The [MIDI pitch, offset, duration] fingerprint entry of a note
+        (-1 for rests and unpitched), with the note's offset and duration.
+        As in music21, chord members take the offset and duration of the chord's first note,
+        and grace notes have no duration.
+        """
+        if isChordNote:
+            noteOffset = self.lastNoteOffset
+            noteDuration = self.lastNoteDuration
+        else:
+            noteOffset = self.offset
+            noteDuration = 0 if mxNote.find("grace") is not None else self._duration(mxNote)
+            self.offset += noteDuration
+        self.lastNoteOffset = noteOffset
+        self.lastNoteDuration = noteDuration
+
+        mxPitch = mxNote.find("pitch")
+        if mxPitch is not None:
+            midi = round((int(mxPitch.findtext("octave")) + 1) * 12
+                         + _STEP_PITCH_CLASSES[mxPitch.findtext("step")]
+                         + float(mxPitch.findtext("alter", "0")))
+        else:  # Rest or unpitched
+            midi = -1
+        return [midi, int(noteOffset * 480), int(noteDuration * 480)], noteOffset, noteDuration
+
+    def _countNote(self, mxNote, isChordNote: bool, noteEntry: list, noteOffset, noteDuration):
+        """
+        Count notes and rests as music21 does to find full measure rests
+        (counting each chord as one note), and keep the first rest.
+        """
+        mxRest = mxNote.find("rest")
+        if mxRest is not None:
+            self.restCount += 1
+            markedFull = mxRest.get("measure") == "yes" \
+                and mxNote.findtext("type") in {None, "whole", "breve"}
+            self.fullMeasureRest = self.fullMeasureRest or markedFull
+            if self.firstRest is None:
+                self.firstRest = (noteEntry, mxNote, noteOffset, noteDuration, markedFull)
+        elif isChordNote:
+            if self.lastNoteCounted:
+                self.noteCount -= 1
+        else:
+            self.noteCount += 1
+        self.lastNoteCounted = mxRest is None and not isChordNote
+
+    def _addLyrics(self, mxNote, noteOffset):
+        """
+        Keep the lyrics of a note, with those of the other notes of a chord
+        (music21 gathers all of a chord's lyrics on the chord).
+        """
+        texts = [_lyricText(mxLyric) for mxLyric in mxNote.findall("lyric")]
+        if texts and self.chordEntry is not None:
+            self.chordEntry[2].extend(texts)
+        elif texts:
+            self.chordEntry = [int(mxNote.findtext("staff", "1")), noteOffset, texts,
+                               self.useVoices, self.voice]
+            self.entries.append(self.chordEntry)
+
+    def _parseForward(self, mxForward):
+        """
+        Move forward, as music21: filling the gap with a hidden rest in files from Finale.
+        """
+        forwardDuration = self._duration(mxForward)
+        if self.finale:
+            self.notes.setdefault(int(mxForward.findtext("staff", "1")), []).append(
+                [-1, int(self.offset * 480), int(forwardDuration * 480)])
+        self.offset += forwardDuration
+
+    def _parseDirection(self, mxDirection):
+        """
+        Keep the words of a direction as text expressions, as music21: including empty ones,
+        but not those that music21 reads as repeat expressions instead (e.g. "D.C.").
+        """
+        directionOffset = self.offset
+        if mxDirection.find("offset") is not None:
+            directionOffset += fractions.Fraction(int(float(mxDirection.findtext("offset"))),
+                                                  self.divisions)
+        staffNumber = int(mxDirection.findtext("staff", "1"))
+        for words in mxDirection.findall("direction-type/words"):
+            text = (words.text or "").strip()
+            if expressions.TextExpression(text).getRepeatExpression() is None:
+                self.entries.append([staffNumber, directionOffset, [text], False, ""])
+
+    def _applyFullMeasureRest(self, barDuration):
+        """
+        Make a full measure rest last the whole measure, as music21 does on import
+        (outside voices): a rest marked as such, or the only item in a measure,
+        if it is a whole or breve rest.
+        """
+        if self.restCount == 1 and self.noteCount == 0:
+            self.fullMeasureRest = True
+        if not self.fullMeasureRest or self.firstRest is None or self.useVoices:
+            return
+        restEntry, mxRest, restOffset, restDuration, markedFull = self.firstRest
+        restType = mxRest.findtext("type") or {4: "whole", 8: "breve"}.get(restDuration)
+        if markedFull or (restDuration != barDuration
+                          and restType in {"whole", "breve"}
+                          and mxRest.find("dot") is None
+                          and mxRest.find("time-modification") is None):
+            restEntry[2] = int(barDuration * 480)
+            self.highestTime = max(self.highestTime, restOffset + barDuration)
+
+    def _paddingLeft(self, barDuration):
+        """
+        The padding of an anacrusis, following music21's treatment on import:
+        for a short first measure, or the second of two short measures in a row.
+        """
+        paddingLeft = 0
+        if self.highestTime == 0:  # Empty measure (filled with a rest in music21)
+            self.lastMeasureWasShort = False
+        elif self.highestTime < barDuration:
+            if self.firstMeasure:
+                paddingLeft = barDuration - self.highestTime
+            elif self.lastMeasureWasShort:
+                paddingLeft = barDuration - self.highestTime
+                self.lastMeasureWasShort = False
+            else:
+                self.lastMeasureWasShort = True
+        self.firstMeasure = False
+        return paddingLeft
+
+    def _measureAnnotations(self, measureNumber: int, paddingLeft):
+        """
+        Add the measure's annotations to their staves, in music21's order:
+        by offset (stably), and voice by voice where there are voices.
+        music21 only applies the padding to elements directly in the measure, not in voices.
+        """
+        self.entries.sort(key=lambda entry: (entry[4] if entry[3] else "", entry[1]))
+        for staffNumber, entryOffset, texts, inVoice, _ in self.entries:
+            text = "\n".join(texts)
+            if not text and self.annotationTextClass == "Lyric":
+                continue  # As music21 (only notes with lyrics), but all text expressions
+            beat = _beatFromOffset(self.timeSignature,
+                                   entryOffset if inVoice else entryOffset + paddingLeft)
+            self.staves.setdefault(staffNumber, []).append([measureNumber, beat, text])
+
+
+def _lyricText(mxLyric) -> str:
+    """
+    The text of one MusicXML <lyric>, as music21's Lyric.text:
+    stripped, and with any syllables of a composite lyric joined by their elisions.
+    """
+    mxTexts = mxLyric.findall("text")
+    mxSyllabics = mxLyric.findall("syllabic")
+    mxElisions = mxLyric.findall("elision")
+    text = (mxTexts[0].text or "").strip() if mxTexts else ""
+    for i, mxText in enumerate(mxTexts[1:], start=1):
+        elision = " "  # music21 default where the syllabic or elision is missing
+        if i < len(mxSyllabics) and i - 1 < len(mxElisions):
+            elision = mxElisions[i - 1].text or ""
+        text += elision + (mxText.text or "").strip()
+    return text
+
+
+_STEP_PITCH_CLASSES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+
+_TIME_SIGNATURES = {}
+
+
+def _timeSignature(ratioString: str) -> meter.TimeSignature:
+    """
+    Shared (cached) music21 TimeSignature for a ratio string, used for beat positions only.
+    """
+    if ratioString not in _TIME_SIGNATURES:
+        _TIME_SIGNATURES[ratioString] = meter.TimeSignature(ratioString)
+    return _TIME_SIGNATURES[ratioString]
+
+
+def _beatFromOffset(timeSignature: meter.TimeSignature,
+                    offset) -> float | fractions.Fraction:
+    """
+    The beat, as music21's .beat, of a position `offset` quarter notes into a measure
+    (including any padding) in the prevailing time signature.
+    """
+    offset = common.opFrac(offset)
+    barDuration = common.opFrac(timeSignature.barDuration.quarterLength)
+    if offset >= barDuration:
+        offset = common.opFrac(offset % barDuration)
+    return timeSignature.getBeatProportion(offset)
+
+
+def _isFromFinale(mxIdentification) -> bool:
+    """
+    Whether the first software named in the encoding is Finale, as music21 checks
+    for its Finale workarounds.
+    """
+    software = [t.text.strip() for t in mxIdentification.iterfind("encoding/software")
+                if t.text and t.text.strip()]
+    return bool(software) and "Finale" in software[0]
+
+
+def _addMetadata(elem, md: metadata.Metadata):
+    """
+    Add the metadata that prepPreamble uses from one top-level MusicXML element.
+    """
+    if elem.tag == "work":
+        if elem.findtext("work-title"):
+            md.title = elem.findtext("work-title")
+    elif elem.tag == "movement-number":
+        if elem.text:
+            md.movementNumber = elem.text
+    elif elem.tag == "movement-title":
+        if elem.text:
+            md.movementName = elem.text
+    else:  # identification
+        for creator in elem.findall("creator"):
+            if creator.get("type") == "composer" and creator.text and not md.composer:
+                md.composer = creator.text.strip()
 
 
 # ------------------------------------------------------------------------------
 
 # Static functions
 
+@lru_cache(maxsize=128)
+def getKey(keyName: str) -> key.Key:
+    """
+    Shared (cached) music21 Key for a key name (e.g. "C", "d").
+    """
+    return key.Key(keyName)
+
+
+def rnFigureFromChord(ch: chord.Chord,
+                      keyName: str,
+                      preferSecondaryDominants: bool = False) -> str:
+    """
+    The figure of music21's roman.romanNumeralFromChord for this chord in this key.
+
+    Chords recur a lot (e.g. the same V7 in G throughout a chorale),
+    so figures are cached by everything the figure depends on:
+    the key and the chord's pitches (spelling and voicing, though not the overall octave).
+    Note that the voicing matters: music21 includes doublings in some figures.
+    """
+    lowestOctave = min(p.implicitOctave for p in ch.pitches)
+    pitches = tuple((p.name, p.implicitOctave - lowestOctave) for p in ch.pitches)
+    return _rnFigure(pitches, keyName, preferSecondaryDominants)
+
+
+@lru_cache(maxsize=4096)
+def _rnFigure(pitches: tuple,
+              keyName: str,
+              preferSecondaryDominants: bool) -> str:
+    """
+    Cached figure for rnFigureFromChord, from the chord's (name, octave above the lowest) pitches.
+    """
+    ch = chord.Chord([f"{name}{octave + 4}" for name, octave in pitches])
+    rn = roman.romanNumeralFromChord(ch,
+                                     getKey(keyName),
+                                     preferSecondaryDominants=preferSecondaryDominants)
+    return str(rn.figure)
+
+
 def getLocalKey(local_key: chord.Chord,
                 global_key: key.Key):
     """
@@ -545,6 +1236,38 @@ def getLocalKey(local_key: chord.Chord,
         raise ValueError(f"The local_key (currently {local_key}) must be a major or minor triad.")
 
 
+_LEGAL_CHARACTERS = frozenset(["#", "b", "-",
+                               "+", "o", "ø",
+                               ":", "[", "]", "/",
+
+                               "a", "b", "c", "d", "e", "f", "g",
+                               "i", "v",
+                               "n",  # for "[no3]"
+
+                               "1", "2", "3", "4", "5", "6", "7", "8", "9"])
+
+
+class _FixTextTable(dict):
+    """
+    Translation table for fixTextRn: single character swaps, and
+    removal of any character that is not legal (in lower case).
+    Entries for other characters are worked out on first look up and then cached,
+    rather than populating the table for every unicode code point in advance.
+    """
+
+    def __missing__(self, codepoint: int):
+        self[codepoint] = codepoint if chr(codepoint).lower() in _LEGAL_CHARACTERS else None
+        return self[codepoint]
+
+
+_FIX_TEXT_TABLE = _FixTextTable({ord("°"): "o",  # e.g. ii°6 > iio6
+                                 ord("("): "[",  # For [no5] style additions
+                                 ord(")"): "]",  # "
+                                 })
+
+_COLON = re.compile(r":\s*")
+
+
 def fixTextRn(textRn: str):
     """
     Adjusts a prospective Roman numeral string such that music21 will accept it.
@@ -561,37 +1284,115 @@ def fixTextRn(textRn: str):
     Finally, it also ensures that there is exactly one space after a colon.
     Music21"s Roman text reader can handle excessive spaces, but not a missing one.
     """
-    # TODO: regex instead?
 
-    swapDict = {"/o": "ø",  # e.g. vii/o7 >  viiø7
-                "°": "o",  # e.g. ii°6 > iio6
-                "(": "[",  # For [no5] style additions
-                ")": "]",  # "
-                }
+    # Swaps, replacements, and removals.
+    # The one multi-character swap first, then one pass for the rest.
+    textRn = textRn.replace("/o", "ø")  # e.g. vii/o7 >  viiø7
+    textRn = textRn.translate(_FIX_TEXT_TABLE)
+
+    # Exactly one space after any colons, all previous spaces having being removed
+    return _COLON.sub(": ", textRn)
+
 
-    legalCharacters = ["#", "b", "-",
-                       "+", "o", "ø",
-                       ":", "[", "]", "/",
+def _partFingerprints(score) -> list:
+    """
+    For each part of the score, one (uint64) fingerprint per measure,
+    such that measures with equal fingerprints have the same notes.
 
-                       "a", "b", "c", "d", "e", "f", "g",
-                       "i", "v",
-                       "n",  # for "[no3]"
+    Each note or rest (including those in voices) is described by
+    its MIDI pitch (all pitches of a chord, -1 for a rest or unpitched),
+    offset, and duration (the latter two in ticks of 1/480 quarter notes): see _notesFingerprint.
 
-                       "1", "2", "3", "4", "5", "6", "7", "8", "9"]
+    This is stricter than music21's RepeatFinder, which only compares
+    the first pitch of chords and ignores the contents of voices altogether.
+    """
 
-    # Swaps, replacements, and removals
-    for k in swapDict.keys():
-        if k in textRn:
-            textRn = textRn.replace(k, swapDict[k])
+    fingerprints = []
+    for p in score.parts:
+        measures = p.getElementsByClass(stream.Measure)
+        fingerprints.append(np.zeros(len(measures), dtype=np.uint64))
+        for measureIndex, m in enumerate(measures):
+            notes = []
+            for n in m.recurse().notesAndRests:
+                offset = int(n.offset * 480)
+                duration = int(n.duration.quarterLength * 480)
+                if n.isNote:
+                    notes.append([n.pitch.midi, offset, duration])
+                elif n.isChord:
+                    for pitch in n.pitches:
+                        notes.append([pitch.midi, offset, duration])
+                else:  # Rest or Unpitched
+                    notes.append([-1, offset, duration])
+            fingerprints[-1][measureIndex] = _notesFingerprint(notes)
+
+    return fingerprints
+
+
+def _notesFingerprint(notes: list) -> int:
+    """
+    Hash of a list of [MIDI pitch, offset, duration] entries, independent of their order
+    (and so of the order of voices, or of the notes in a chord).
+    """
+    data = np.array(sorted(notes), dtype="<i4").tobytes()
+    digest = hashlib.blake2b(data, digest_size=8).digest()
+    return int.from_bytes(digest, "little")
 
-    for char in textRn:
-        if char.lower() not in legalCharacters:
-            textRn = textRn.replace(char, "")
 
-    # Exactly one space after any colons, all previous spaces having being removed
-    textRn = textRn.replace(":", ": ")
+def _measureFingerprints(partFingerprints: list) -> np.ndarray:
+    """
+    Combine the fingerprints of each part (see _partFingerprints)
+    into one fingerprint per measure across all the parts.
+    """
+    for fThis, fNext in zip(partFingerprints, partFingerprints[1:]):
+        if len(fThis) != len(fNext):
+            raise ValueError("Parts must each have the same number of measures.")
+    if not partFingerprints:
+        return np.array([], dtype=np.uint64)
+
+    columns = np.ascontiguousarray(np.stack(partFingerprints).T, dtype="<u8")
+    digests = [hashlib.blake2b(column.tobytes(), digest_size=8).digest() for column in columns]
+    return np.array([int.from_bytes(digest, "little") for digest in digests], dtype=np.uint64)
+
+
+def _similarMeasureGroups(fingerprints: np.ndarray,
+                          firstMeasureNumber: int = 1,
+                          threshold: int = 1) -> list:
+    """
+    Given one fingerprint per measure, find groups of repeated measures, returning
+    a list of tuples (l1, l2) where l1 and l2 are lists of (contiguous) measure numbers
+    such that measure l1[i] is the same as measure l2[i] and l1 ends before l2 begins.
+
+    The groups and their order are as for music21's RepeatFinder.getSimilarMeasureGroups,
+    without its pairwise comparison of measures:
+    for a repeat at a distance of d measures, the measures equal to the one d later
+    form contiguous runs (found with numpy for each d), and each run gives a group
+    from its start, truncated to d measures (no overlap), and
+    a group of d measures from each later point that is at least d measures from the run end.
+    """
+
+    ids = np.unique(fingerprints, return_inverse=True)[1].ravel()  # Equal measures, equal ids
+    numMeasures = len(ids)
+
+    groups = []  # (start, distance, length), as measure indices
+    for distance in range(1, numMeasures):
+        equal = np.flatnonzero(ids[:-distance] == ids[distance:])
+        if not len(equal):
+            continue
+        breaks = np.flatnonzero(np.diff(equal) > 1)  # Split into runs of contiguous measures
+        for runStart, runEnd in zip(equal[np.concatenate(([0], breaks + 1))],
+                                    equal[np.concatenate((breaks, [len(equal) - 1]))]):
+            runStart, runEnd = int(runStart), int(runEnd)
+            groups.append((runStart, distance, min(runEnd - runStart + 1, distance)))
+            for start in range(runStart + 1, runEnd - distance + 2):
+                groups.append((start, distance, distance))
 
-    return textRn
+    groups = [g for g in groups if g[2] >= threshold]
+    groups.sort(key=lambda g: (-g[2], g[0], g[0] + g[1]))  # Longest first, then earliest
+
+    return [(list(range(start + firstMeasureNumber, start + firstMeasureNumber + length)),
+             list(range(start + distance + firstMeasureNumber,
+                        start + distance + firstMeasureNumber + length)))
+            for start, distance, length in groups]
 
 
 def rnString(measureBeatStringList: list,
@@ -605,14 +1406,13 @@ def rnString(measureBeatStringList: list,
     """
 
     if not inString:  # New line
-        inString = "m" + str(measureBeatStringList[0])
+        inString = f"m{measureBeatStringList[0]}"
 
-    bt = measureBeatStringList[1]
-    bt = intBeat(bt)
+    bt = intBeat(measureBeatStringList[1])
     if bt == 1:
-        return " ".join([inString, str(measureBeatStringList[2])])
+        return f"{inString} {measureBeatStringList[2]}"
     else:
-        return inString + " b" + str(bt) + " " + str(measureBeatStringList[2])
+        return f"{inString} b{bt} {measureBeatStringList[2]}"
 
 
 def intBeat(beat,
@@ -622,18 +1422,16 @@ def intBeat(beat,
     Accepts input as string, int or float.
     """
 
-    options = [str, int, float, fractions.Fraction]
-
-    if type(beat) not in options:
-        raise ValueError(f"Beat, (currently {beat}) must be one of {options}.")
-
-    if type(beat) in [str, fractions.Fraction]:
+    if isinstance(beat, (str, fractions.Fraction)):
         beat = float(beat)
+    elif not isinstance(beat, (int, float)):
+        raise ValueError(f"Beat, (currently {beat}) must be one of "
+                         f"{[str, int, float, fractions.Fraction]}.")
 
-    if int(beat) == beat:
+    if isinstance(beat, int) or beat.is_integer():
         return int(beat)
     else:
-        return round(float(beat), roundValue)
+        return round(beat, roundValue)
 
 
 # ------------------------------------------------------------------------------
@@ -641,7 +1439,6 @@ def intBeat(beat,
 if __name__ == "__main__":
 
     import argparse
-    from music21 import converter
 
     parser = argparse.ArgumentParser()
 
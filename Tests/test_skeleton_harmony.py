@@ -1,13 +1,29 @@
+import functools
+import os
+import shutil
+import tempfile
 import unittest
 
-from music21 import converter
+from music21 import converter, stream
 
-from Code.skeletonHarmony import RnAnalysis, rnString, intBeat, fixTextRn
+import numpy as np
+
+from Code.skeletonHarmony import (RnAnalysis, makeTemplate, makeTemplates,
+                                  rnString, intBeat, fixTextRn, _similarMeasureGroups)
 from Code import CORPUS_FOLDER
 
 from . import TEST_RESOURCES_FOLDER
 
 
+@functools.lru_cache(maxsize=None)
+def parseCached(path):
+    """
+    Parse each test score once per run and share it between tests (which must not change it).
+    Between runs, music21 keeps its own pickles of parsed scores.
+    """
+    return converter.parse(path)
+
+
 class Test(unittest.TestCase):
 
     def testFullAnalysis(self):
@@ -17,13 +33,56 @@ class Test(unittest.TestCase):
         we use the shared `TEST_RESOURCES_FOLDER` example (from Clara Schumann).
         """
 
-        score = converter.parse(TEST_RESOURCES_FOLDER / "Example" / "analysis_on_score.mxl")
+        score = parseCached(TEST_RESOURCES_FOLDER / "Example" / "analysis_on_score.mxl")
         rna = RnAnalysis(score)
         rna.prepList(template=False)  # ***
 
         self.assertEqual(rna.combinedList[0], "\nTime Signature: 4/4")
         self.assertEqual(rna.combinedList[15], "m13 I b3 i6")
 
+        preamble = list(rna.preamble)
+        rna.prepPreamble()  # No duplicate entries
+        self.assertEqual(rna.preamble, preamble)
+
+    # ------------------------------------------------------------------------------
+
+    def testFromFast(self):
+        """
+        Test that the fast loader (RnAnalysis.fromFast) retrieves the same
+        measures, time signatures, metadata and annotations as the music21 parse.
+        Cases include lyrics (on the lowest part by default),
+        and on the top part: text expressions after a <backup> (m42-45),
+        text expressions that music21 imports as repeat expressions ("Fine", "D.C. al Fine"),
+        and a whitespace-only lyric (m34).
+        """
+
+        lieder = CORPUS_FOLDER / "OpenScore-LiederCorpus"
+        brahms = lieder / "Brahms,_Johannes" / "6_Songs,_Op.3"
+        paradis = lieder / "Paradis,_Maria_Theresia_von" / "12_Lieder,_1786"
+        hensel = lieder / "Hensel,_Fanny_(Mendelssohn)" / "6_Lieder,_Op.1"
+        for path, analysisPartNo, annotationTextClass in [
+            (TEST_RESOURCES_FOLDER / "Example" / "analysis_on_score.mxl", -1, "Lyric"),
+            (brahms / "4_Lied_aus_dem_Gedicht_„Ivan“" / "score.mxl", 0, "TextExpression"),
+            (paradis / "09_Vaterlandslied" / "score.mxl", 0, "TextExpression"),
+            (hensel / "5_Morgenständchen" / "score.mxl", 0, "Lyric"),
+        ]:
+            kwargs = {"analysisPartNo": analysisPartNo, "annotationTextClass": annotationTextClass}
+            with self.subTest(path=path.parent.name, **kwargs):
+                rna = RnAnalysis(parseCached(path), **kwargs)
+                rnaFast = RnAnalysis.fromFast(path, **kwargs)
+
+                # No music21 parse needed for any of the following
+                self.assertIsNone(rnaFast._score)
+                for attribute in ["firstMeasureNumber", "lastMeasureNumber",
+                                  "timeSigMeasureDict", "preamble", "composer", "title"]:
+                    self.assertEqual(getattr(rnaFast, attribute), getattr(rna, attribute))
+
+                rna.getAnnotationsAndLocations()
+                rnaFast.getAnnotationsAndLocations()
+                self.assertEqual(rnaFast.annotationsAndLocations,
+                                 [[m, float(b), txt] for m, b, txt in rna.annotationsAndLocations])
+                self.assertIsNone(rnaFast._score)
+
     # ------------------------------------------------------------------------------
 
     def testPartialAnalysis(self):
@@ -32,7 +91,7 @@ class Test(unittest.TestCase):
         See the dedicated partial analysis in the `TEST_RESOURCES_FOLDER` example.
         """
 
-        score = converter.parse(TEST_RESOURCES_FOLDER / "testPartialAnalysis.mxl")
+        score = parseCached(TEST_RESOURCES_FOLDER / "testPartialAnalysis.mxl")
 
         preludeAnalysis = RnAnalysis(score,
                                      composer="J.S. Bach",
@@ -47,6 +106,17 @@ class Test(unittest.TestCase):
         self.assertEqual(da[19], [20, 1.0, "V7/IV"])
         self.assertEqual(da[22], [23, 1.0, "viio42"])
 
+        # Measure numbers that restart (as in a minuet and trio) make no difference
+        renumbered = converter.parse(TEST_RESOURCES_FOLDER / "testPartialAnalysis.mxl")
+        for p in renumbered.parts:
+            for m in p.getElementsByClass(stream.Measure):
+                if m.number >= 19:
+                    m.number -= 18
+        renumberedAnalysis = RnAnalysis(renumbered)
+        renumberedAnalysis.chfyChordAndLabel(ignoreParts=2)
+        self.assertEqual([x[2] for x in renumberedAnalysis.deducedAnalysis], [x[2] for x in da])
+        self.assertEqual(renumberedAnalysis.deducedAnalysis[19], [2, 1.0, "V7/IV"])
+
     # ------------------------------------------------------------------------------
 
     def testTemplate(self):
@@ -54,20 +124,112 @@ class Test(unittest.TestCase):
         Test the creation of an analysis template from a score within the corpus.
         """
 
-        from music21 import converter
-
         corpus = CORPUS_FOLDER / "OpenScore-LiederCorpus"
         composer = "Hensel,_Fanny_(Mendelssohn)"
         collection = "5_Lieder,_Op.10"
         song = "1_Nach_Süden"
 
-        score = converter.parse(corpus / composer / collection / song / "score.mxl")
+        path = corpus / composer / collection / song / "score.mxl"
+        score = parseCached(path)
         rna = RnAnalysis(score)
         rna.prepList(template=True)  # ***
 
         self.assertEqual(rna.combinedList[0], "\nTime Signature: 12/8")
         self.assertEqual(rna.combinedList[15], "m14 b1")
 
+        with tempfile.TemporaryDirectory() as outPath:
+            rnaFast = makeTemplate(path, outPath=outPath)
+            self.assertIsNone(rnaFast._score)  # No music21 parse
+            self.assertEqual(rnaFast.combinedList, rna.combinedList)
+            self.assertEqual(os.listdir(outPath), [f"{rnaFast.composer}_-_{rnaFast.title}.txt"])
+
+            # The analysis part plays no part in a template
+            rnaFast = makeTemplate(path, outPath=outPath, analysisPartNo=99)
+            self.assertEqual(rnaFast.combinedList, rna.combinedList)
+            with self.assertRaises(ValueError):
+                rnaFast.getAnnotationsAndLocations()
+
+    # ------------------------------------------------------------------------------
+
+    def testProcessTemplateParts(self):
+        """
+        Test the selection of parts to compare for repeats in a template.
+        """
+
+        path = TEST_RESOURCES_FOLDER / "testPartialAnalysis.mxl"
+        score = parseCached(path)
+        numParts = len(score.parts)
+
+        rna = RnAnalysis(score, templateParts=list(range(numParts)))
+        rna.processTemplateParts()
+        self.assertIs(rna.tempScore, score)  # All parts: the score itself
+
+        rna = RnAnalysis(score, templateParts=[1, 0])
+        rna.processTemplateParts()
+        self.assertEqual(list(rna.tempScore.parts), list(score.parts[:2]))  # In score order
+
+        rnaFast = RnAnalysis.fromFast(path, templateParts=[1, 0])
+        rnaFast.processTemplateParts()
+        self.assertEqual(len(rnaFast.tempPartFingerprints), 2)
+
+        for templateParts in ["some", [0, -1], [numParts]]:
+            rna = RnAnalysis(score, templateParts=templateParts)
+            self.assertRaises(ValueError, rna.processTemplateParts)
+
+    # ------------------------------------------------------------------------------
+
+    def testMakeTemplates(self):
+        """
+        Test making templates for several scores in parallel, each written beside its score.
+        """
+
+        with tempfile.TemporaryDirectory() as tempDir:
+            paths = []
+            for source in [TEST_RESOURCES_FOLDER / "Example" / "analysis_on_score.mxl",
+                           TEST_RESOURCES_FOLDER / "testPartialAnalysis.mxl"]:
+                directory = os.path.join(tempDir, source.stem)
+                os.mkdir(directory)
+                paths.append(os.path.join(directory, "score.mxl"))
+                shutil.copyfile(source, paths[-1])
+
+            existing = os.path.join(os.path.dirname(paths[0]), "template.txt")
+            with open(existing, "w", encoding="utf-8") as f:
+                f.write("Work in progress")
+
+            makeTemplates(paths, workers=2)
+
+            def assertTemplate(path):
+                templatePath = os.path.join(os.path.dirname(path), "template.txt")
+                with open(templatePath, encoding="utf-8") as f:
+                    rna = makeTemplate(path, outPath=tempDir)
+                    lines = rna.preamble + rna.combinedList
+                    self.assertEqual(f.read(), "".join(f"{x}\n" for x in lines))
+
+            with open(existing, encoding="utf-8") as f:
+                self.assertEqual(f.read(), "Work in progress")  # Not overwritten by default
+            assertTemplate(paths[1])
+
+            makeTemplates(paths, overwrite=True, workers=2)
+
+            for path in paths:
+                assertTemplate(path)
+
+    # ------------------------------------------------------------------------------
+
+    def testSimilarMeasureGroups(self):
+        """
+        Test the grouping of repeated measures from their fingerprints
+        (same groups and order as music21's RepeatFinder.getSimilarMeasureGroups).
+        """
+
+        fingerprints = np.array([1, 2, 3, 4, 1, 2, 3, 4, 9], dtype=np.uint64)
+        self.assertEqual(_similarMeasureGroups(fingerprints),
+                         [([1, 2, 3, 4], [5, 6, 7, 8])])
+
+        fingerprints = np.array([5, 5, 5], dtype=np.uint64)  # Overlapping
+        self.assertEqual(_similarMeasureGroups(fingerprints, firstMeasureNumber=0),
+                         [([0], [1]), ([0], [2]), ([1], [2])])
+
     # ------------------------------------------------------------------------------
 
     def testRnString(self):
@@ -104,3 +266,9 @@ class Test(unittest.TestCase):
 
         testString = "ii°6"
         self.assertEqual(fixTextRn(testString), "iio6")
+
+        for testString in ["bVI", "#ivo7", "VIIØ7", "V+", "Bb: V7/IV"]:  # Legal in either case
+            self.assertEqual(fixTextRn(testString), testString)
+
+        testString = "ii7 (hjkl)"  # Only a-g, i, n, o, v
+        self.assertEqual(fixTextRn(testString), "ii7[]")